@@ -9,6 +9,11 @@ from telebot import types
 from dotenv import load_dotenv
 from datetime import datetime
 import sqlite3
+import csv
+import gzip
+import tempfile
+import threading
+import numpy as np
 from contextlib import contextmanager
 
 load_dotenv()
@@ -19,6 +24,7 @@ bot = telebot.TeleBot(API_TOKEN)
 # Statistika fayllari uchun papka yaratish
 STATS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot_statistics")
 TRAINING_IMAGES_DIR = os.path.join(STATS_DIR, "training_images")
+EMBEDDINGS_DIR = os.path.join(STATS_DIR, "embeddings")
 
 # Papkalarni yaratish va huquqlarni tekshirish
 def ensure_directories():
@@ -33,6 +39,11 @@ def ensure_directories():
             os.makedirs(TRAINING_IMAGES_DIR, mode=0o777)
             print(f"Created directory: {TRAINING_IMAGES_DIR}")
             
+        # Embeddinglar papkasini yaratish
+        if not os.path.exists(EMBEDDINGS_DIR):
+            os.makedirs(EMBEDDINGS_DIR, mode=0o777)
+            print(f"Created directory: {EMBEDDINGS_DIR}")
+            
         # Huquqlarni tekshirish
         if not os.access(TRAINING_IMAGES_DIR, os.W_OK):
             print(f"Warning: No write access to {TRAINING_IMAGES_DIR}")
@@ -93,6 +104,22 @@ def init_database():
         )
         ''')
         
+        # Rasm embeddinglari metama'lumotlari (id = embeddinglar faylidagi qator raqami)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS photo_embeddings (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            disease_name TEXT,
+            confidence REAL,
+            created_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+        ''')
+        
+        # Admin ro'yxatini keyset sahifalash va username bo'yicha qidirish uchun indekslar
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_total_requests ON users (total_requests, user_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_username ON users (username, user_id)')
+        
         conn.commit()
 
 # Foydalanuvchi tilini olish
@@ -296,7 +323,10 @@ def show_admin_panel(message):
         message,
         "Admin panel:\n\n"
         "• Statistika\n"
-        "• Foydalanuvchilar",
+        "• Foydalanuvchilar\n"
+        "• Foydalanuvchi qidirish\n"
+        "• CSV eksport\n"
+        "• O'xshash rasmlar",
         reply_markup=markup
     )
 
@@ -306,9 +336,14 @@ def get_admin_keyboard(lang):
     
     admin_stats_btn = types.KeyboardButton("📊 Admin statistika")
     users_btn = types.KeyboardButton("👥 Foydalanuvchilar")
+    search_btn = types.KeyboardButton("🔍 Foydalanuvchi qidirish")
+    export_btn = types.KeyboardButton("📥 CSV eksport")
+    similar_btn = types.KeyboardButton("🔎 O'xshash rasmlar")
     back_btn = types.KeyboardButton("🔙 Asosiy menyu")
     
     markup.add(admin_stats_btn, users_btn)
+    markup.add(search_btn, export_btn)
+    markup.add(similar_btn)
     markup.add(back_btn)
     
     return markup
@@ -376,32 +411,242 @@ def show_admin_stats(message):
     except Exception as e:
         bot.reply_to(message, f"Xatolik yuz berdi: {str(e)}")
 
+# Admin ro'yxatidagi bitta sahifadagi foydalanuvchilar soni
+USERS_PAGE_SIZE = 10
+
+# Foydalanuvchilar sahifasini keyset usulida olish.
+# prefix bo'lmasa ro'yxat so'rovlar soni bo'yicha (total_requests, user_id) kamayish
+# tartibida, prefix bo'lsa username bo'yicha (username, user_id) o'sish tartibida
+# chiqariladi. Kursor sahifa chetidagi qatorning to'liq kaliti: (kalit qiymati, user_id).
+def get_users_page(cursor_key=None, direction='next', prefix=None):
+    if prefix:
+        key_column = 'username'
+        where = ['username >= ?', 'username < ?']
+        params = [prefix, prefix + '\U0010ffff']
+        forward, backward = ('>', 'ASC'), ('<', 'DESC')
+    else:
+        key_column = 'total_requests'
+        where = []
+        params = []
+        forward, backward = ('<', 'DESC'), ('>', 'ASC')
+    
+    if cursor_key is not None:
+        operator, order = backward if direction == 'prev' else forward
+        where.append(f'({key_column}, user_id) {operator} (?, ?)')
+        params += list(cursor_key)
+    else:
+        operator, order = forward
+        direction = 'next'
+    
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ''
+        cursor.execute(f'''
+            SELECT user_id, username, first_activity, last_activity, total_requests
+            FROM users
+            {where_sql}
+            ORDER BY {key_column} {order}, user_id {order}
+            LIMIT ?
+        ''', params + [USERS_PAGE_SIZE + 1])
+        users = cursor.fetchall()
+    
+    has_more = len(users) > USERS_PAGE_SIZE
+    users = users[:USERS_PAGE_SIZE]
+    
+    # Kursordan keyin hech narsa qolmagan bo'lsa, birinchi sahifani ko'rsatish
+    if not users and cursor_key is not None:
+        return get_users_page(prefix=prefix)
+    
+    if direction == 'prev':
+        users.reverse()
+        return users, has_more, True
+    
+    return users, cursor_key is not None, has_more
+
+# Sahifa tugmasi uchun callback_data (kursor kaliti bilan)
+def get_users_page_callback(direction, user, prefix=None):
+    if not prefix:
+        return f"users_{direction}_{user[4]}_{user[0]}"
+    
+    # Qidiruvda prefiks username boshidan uzunligi orqali tiklanadi
+    data = f"usearch_{direction}_{user[0]}_{len(prefix)}_{user[1]}"
+    
+    # Telegram callback_data 64 baytdan oshmasligi kerak. Uzun username bo'lsa,
+    # u user_id orqali qayta olinadi (username yozilgandan keyin o'zgarmaydi)
+    if len(data.encode('utf-8')) > 64:
+        data = f"usearch_{direction}_{user[0]}_{len(prefix)}_"
+    return data
+
+# callback_data dan yo'nalish, kursor kaliti va prefiksni olish
+def parse_users_page_callback(data):
+    if data.startswith('usearch_'):
+        _, direction, user_id, prefix_length, username = data.split('_', 4)
+        if not username:
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT username FROM users WHERE user_id = ?', (int(user_id),))
+                username = cursor.fetchone()[0]
+        return direction, (username, int(user_id)), username[:int(prefix_length)]
+    
+    _, direction, total_requests, user_id = data.split('_', 3)
+    return direction, (int(total_requests), int(user_id)), None
+
+# Foydalanuvchilar sahifasi matni va navigatsiya tugmalari
+def build_users_page(users, has_prev, has_next, prefix=None):
+    if prefix:
+        text = f"🔍 \"{prefix}\" bo'yicha foydalanuvchilar:\n\n"
+    else:
+        text = "👥 Foydalanuvchilar ro'yxati:\n\n"
+    
+    if not users:
+        text += "Foydalanuvchilar topilmadi."
+    
+    for user in users:
+        text += f"👤 {user[1]}\n"
+        text += f"📅 Birinchi faollik: {user[2]}\n"
+        text += f"🕒 Oxirgi faollik: {user[3]}\n"
+        text += f"📊 So'rovlar: {user[4]}\n"
+        text += "➖➖➖➖➖➖➖➖\n"
+    
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    buttons = []
+    if has_prev:
+        buttons.append(types.InlineKeyboardButton("⬅️ Oldingi", callback_data=get_users_page_callback('prev', users[0], prefix)))
+    if has_next:
+        buttons.append(types.InlineKeyboardButton("Keyingi ➡️", callback_data=get_users_page_callback('next', users[-1], prefix)))
+    if buttons:
+        markup.add(*buttons)
+    
+    return text, markup
+
 @bot.message_handler(func=lambda message: message.text == "👥 Foydalanuvchilar")
 def show_users_list(message):
     if not is_admin(message.from_user.id):
         return
         
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT username, first_activity, last_activity, total_requests
-                FROM users
-                ORDER BY total_requests DESC
-                LIMIT 20
-            ''')
-            users = cursor.fetchall()
-            
-            text = "👥 Foydalanuvchilar ro'yxati (top 20):\n\n"
-            for user in users:
-                text += f"👤 {user[0]}\n"
-                text += f"📅 Birinchi faollik: {user[1]}\n"
-                text += f"🕒 Oxirgi faollik: {user[2]}\n"
-                text += f"📊 So'rovlar: {user[3]}\n"
-                text += "➖➖➖➖➖➖➖➖\n"
+        users, has_prev, has_next = get_users_page()
+        text, markup = build_users_page(users, has_prev, has_next)
+        bot.reply_to(message, text, reply_markup=markup)
             
-            bot.reply_to(message, text)
+    except Exception as e:
+        bot.reply_to(message, f"Xatolik yuz berdi: {str(e)}")
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('users_') or call.data.startswith('usearch_'))
+def callback_users_page(call):
+    if not is_admin(call.from_user.id):
+        bot.answer_callback_query(call.id)
+        return
+    
+    error_text = None
+    try:
+        direction, cursor_key, prefix = parse_users_page_callback(call.data)
+        users, has_prev, has_next = get_users_page(cursor_key, direction, prefix)
+        text, markup = build_users_page(users, has_prev, has_next, prefix)
+        try:
+            bot.edit_message_text(
+                chat_id=call.message.chat.id,
+                message_id=call.message.message_id,
+                text=text,
+                reply_markup=markup
+            )
+        except telebot.apihelper.ApiTelegramException as e:
+            # Sahifa o'zgarmagan bo'lsa, Telegram xato qaytaradi
+            if "message is not modified" not in str(e):
+                raise
+    except Exception as e:
+        error_text = f"Xatolik yuz berdi: {str(e)}"[:200]
+    
+    bot.answer_callback_query(call.id, error_text)
+
+@bot.message_handler(func=lambda message: message.text == "🔍 Foydalanuvchi qidirish")
+def ask_users_search(message):
+    if not is_admin(message.from_user.id):
+        return
+    
+    msg = bot.reply_to(message, "Qidirish uchun username boshini yuboring:")
+    bot.register_next_step_handler(msg, show_users_search)
+
+# Klaviatura tugmalari matnlari (qidiruv so'zi sifatida qabul qilinmaydi)
+MENU_BUTTON_TEXTS = {
+    "📊 Statistika", "❓ Yordam", "🌐 Til", "👨‍💻 Admin panel",
+    "📊 Admin statistika", "👥 Foydalanuvchilar", "🔍 Foydalanuvchi qidirish",
+    "📥 CSV eksport", "🔎 O'xshash rasmlar", "🔙 Asosiy menyu"
+}
+
+# Username boshi bo'yicha qidiruv natijalarining birinchi sahifasi
+def show_users_search(message):
+    # Qidiruv o'rniga tugma bosilgan yoki buyruq yuborilgan bo'lsa, qidiruvni bekor
+    # qilib, xabarni oddiy handlerlarga uzatish
+    if message.text and (message.text in MENU_BUTTON_TEXTS or message.text.startswith('/')):
+        bot.process_new_messages([message])
+        return
+    
+    prefix = (message.text or '').strip().lstrip('@')
+    if not prefix:
+        bot.reply_to(message, "Qidiruv so'zi bo'sh.")
+        return
+    
+    try:
+        users, has_prev, has_next = get_users_page(prefix=prefix)
+        text, markup = build_users_page(users, has_prev, has_next, prefix)
+        bot.reply_to(message, text, reply_markup=markup)
+        
+    except Exception as e:
+        bot.reply_to(message, f"Xatolik yuz berdi: {str(e)}")
+
+# Eksportda bitta so'rov bilan o'qiladigan qatorlar soni
+EXPORT_CHUNK_SIZE = 5000
+
+# Jadvalni gzip qilingan CSV faylga yozish.
+# Jadval asosiy kalit (columns[0]) bo'yicha bo'laklab o'qiladi: har bir so'rov tez
+# tugaydi va o'qish qulfini qo'yib yuboradi, shuning uchun eksport vaqtida
+# foydalanuvchilar statistikasini yozish to'xtab qolmaydi.
+def export_table_csv(table, columns, path):
+    key_column = columns[0]
+    column_list = ', '.join(columns)
+    last_key = None
+    
+    with get_db_connection() as conn, gzip.open(path, 'wt', newline='', encoding='utf-8') as f:
+        cursor = conn.cursor()
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        
+        while True:
+            if last_key is None:
+                cursor.execute(f'SELECT {column_list} FROM {table} ORDER BY {key_column} LIMIT ?', (EXPORT_CHUNK_SIZE,))
+            else:
+                cursor.execute(f'''
+                    SELECT {column_list} FROM {table}
+                    WHERE {key_column} > ?
+                    ORDER BY {key_column}
+                    LIMIT ?
+                ''', (last_key, EXPORT_CHUNK_SIZE))
+            rows = cursor.fetchall()
+            if not rows:
+                break
             
+            writer.writerows(rows)
+            last_key = rows[-1][0]
+
+@bot.message_handler(func=lambda message: message.text == "📥 CSV eksport")
+def send_csv_export(message):
+    if not is_admin(message.from_user.id):
+        return
+    
+    exports = [
+        ('users', ['user_id', 'username', 'first_activity', 'last_activity', 'total_requests']),
+        ('disease_history', ['id', 'user_id', 'disease_name', 'confidence', 'detected_at'])
+    ]
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for table, columns in exports:
+                path = os.path.join(tmp_dir, f"{table}.csv.gz")
+                export_table_csv(table, columns, path)
+                with open(path, 'rb') as f:
+                    bot.send_document(message.chat.id, f, reply_to_message_id=message.message_id)
+                    
     except Exception as e:
         bot.reply_to(message, f"Xatolik yuz berdi: {str(e)}")
 
@@ -581,6 +826,309 @@ remedies = {
     }
 }
 
+# Rasm embeddinglari indeksi.
+# Vektorlar float16 ko'rinishida bitta faylga ketma-ket yoziladi va ishga tushishda
+# memmap orqali ochiladi. Taxminiy qo'shnilarni topish uchun tasodifiy
+# giperteksliklarga asoslangan LSH ishlatiladi. Har bir vektorning LSH kodlari
+# alohida faylga yoziladi, har bir jadval uchun kodlar bo'yicha tartiblangan qator
+# raqamlari esa yana ikkita faylda saqlanadi va memmap orqali ochiladi. Yangi
+# qatorlar avval kichik xotiradagi bucketlarga tushadi; ular LSH_MERGE_ROWS ga
+# yetganda tartiblangan fayllarga chiziqli birlashtiriladi (to'liq qayta saralanmaydi).
+# ViT CLS embeddinglari bir tomonga og'gan bo'ladi, shuning uchun xeshlash va
+# solishtirishdan oldin birinchi MEAN_SAMPLE_ROWS ta rasmdan olingan o'rtacha
+# vektor ayiriladi. O'rtacha vektor saqlangach, u o'zgarmaydi.
+class EmbeddingIndex:
+    LSH_TABLES = 8
+    LSH_BITS = 10
+    LSH_SEED = 42
+    LSH_MERGE_ROWS = 10000
+    MEAN_SAMPLE_ROWS = 1000
+    CHUNK_ROWS = 4096
+
+    def __init__(self, directory, dim):
+        self.dim = dim
+        self.vectors_path = os.path.join(directory, "embeddings.f16")
+        self.codes_path = os.path.join(directory, "lsh_codes.u16")
+        self.sorted_ids_path = os.path.join(directory, "lsh_sorted_ids.i32")
+        self.sorted_codes_path = os.path.join(directory, "lsh_sorted_codes.u16")
+        self.mean_path = os.path.join(directory, "mean.f32")
+        self.row_bytes = dim * np.dtype(np.float16).itemsize
+        self.code_bytes = self.LSH_TABLES * np.dtype(np.uint16).itemsize
+        self.lock = threading.Lock()
+
+        rng = np.random.default_rng(self.LSH_SEED)
+        self.planes = rng.standard_normal((self.LSH_TABLES, self.LSH_BITS, dim)).astype(np.float32)
+        self.bit_weights = (1 << np.arange(self.LSH_BITS)).astype(np.uint16)
+        self.sorted_ids = None
+        self.sorted_codes = None
+        self.recent_buckets = [{} for _ in range(self.LSH_TABLES)]
+        self.vectors = None
+        self.codes = None
+        self.mean = None
+        self.count = 0
+        self.indexed = 0
+
+        self._load()
+
+    def _load(self):
+        row_bytes = self.row_bytes
+        code_bytes = self.code_bytes
+        vector_rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        code_rows = os.path.getsize(self.codes_path) // code_bytes if os.path.exists(self.codes_path) else 0
+
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COALESCE(MAX(id) + 1, 0) FROM photo_embeddings')
+            db_rows = cursor.fetchone()[0]
+
+            # Uzilib qolgan yozuvlar bo'lsa, hamma joyda bir xil qator soniga keltirish
+            count = min(vector_rows, code_rows, db_rows)
+            if db_rows > count:
+                cursor.execute('DELETE FROM photo_embeddings WHERE id >= ?', (count,))
+                conn.commit()
+
+        for path, size in ((self.vectors_path, count * row_bytes), (self.codes_path, count * code_bytes)):
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                os.truncate(path, size)
+
+        self.count = count
+        self._remap()
+
+        # O'rtacha vektorni yuklash yoki yetarli rasm bo'lsa hisoblash
+        if os.path.exists(self.mean_path) and os.path.getsize(self.mean_path) == self.dim * np.dtype(np.float32).itemsize:
+            self.mean = np.fromfile(self.mean_path, dtype=np.float32)
+        elif count >= self.MEAN_SAMPLE_ROWS:
+            self._fit_mean()
+
+        # Tartiblangan fayllar qancha qatorni qamrab olishini aniqlash
+        ids_size = os.path.getsize(self.sorted_ids_path) if os.path.exists(self.sorted_ids_path) else 0
+        codes_size = os.path.getsize(self.sorted_codes_path) if os.path.exists(self.sorted_codes_path) else 0
+        indexed = ids_size // (self.LSH_TABLES * np.dtype(np.int32).itemsize)
+        if (
+            indexed > count
+            or ids_size != indexed * self.LSH_TABLES * np.dtype(np.int32).itemsize
+            or codes_size != indexed * self.code_bytes
+        ):
+            # Fayllar mos kelmasa, tartiblangan indeks noldan tuziladi
+            indexed = 0
+        self.indexed = indexed
+        self._map_sorted()
+
+        # Qolgan qatorlar ko'p bo'lsa birlashtirish, aks holda xotiradagi bucketlarga qo'shish
+        if count - indexed >= self.LSH_MERGE_ROWS:
+            self._merge()
+        elif count > indexed:
+            for table in range(self.LSH_TABLES):
+                buckets = self.recent_buckets[table]
+                for idx, code in enumerate(self.codes[indexed:count, table].tolist(), start=indexed):
+                    buckets.setdefault(code, []).append(idx)
+
+        print(f"Embedding indeksi yuklandi: {count} ta rasm.")
+
+    def _remap(self):
+        if self.count:
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float16, mode='r', shape=(self.count, self.dim))
+            self.codes = np.memmap(self.codes_path, dtype=np.uint16, mode='r', shape=(self.count, self.LSH_TABLES))
+        else:
+            self.vectors = None
+            self.codes = None
+
+    def _map_sorted(self):
+        if self.indexed:
+            shape = (self.LSH_TABLES, self.indexed)
+            self.sorted_ids = np.memmap(self.sorted_ids_path, dtype=np.int32, mode='r', shape=shape)
+            self.sorted_codes = np.memmap(self.sorted_codes_path, dtype=np.uint16, mode='r', shape=shape)
+        else:
+            self.sorted_ids = None
+            self.sorted_codes = None
+
+    # Tartiblangan fayllarga hali kirmagan qatorlarni chiziqli birlashtirish
+    def _merge(self):
+        start, end = self.indexed, self.count
+        new_ids = np.arange(start, end, dtype=np.int32)
+        new_codes = self.codes[start:end]
+        shape = (self.LSH_TABLES, end)
+
+        ids_tmp = self.sorted_ids_path + ".tmp"
+        codes_tmp = self.sorted_codes_path + ".tmp"
+        merged_ids = np.memmap(ids_tmp, dtype=np.int32, mode='w+', shape=shape)
+        merged_codes = np.memmap(codes_tmp, dtype=np.uint16, mode='w+', shape=shape)
+
+        for table in range(self.LSH_TABLES):
+            order = np.argsort(new_codes[:, table], kind='stable')
+            table_codes = new_codes[order, table]
+            if start:
+                old_codes = self.sorted_codes[table]
+                positions = np.searchsorted(old_codes, table_codes, side='right') + np.arange(len(order))
+                is_new = np.zeros(end, dtype=bool)
+                is_new[positions] = True
+                merged_codes[table, is_new] = table_codes
+                merged_codes[table, ~is_new] = old_codes
+                merged_ids[table, is_new] = new_ids[order]
+                merged_ids[table, ~is_new] = self.sorted_ids[table]
+            else:
+                merged_codes[table] = table_codes
+                merged_ids[table] = new_ids[order]
+
+        merged_ids.flush()
+        merged_codes.flush()
+        del merged_ids, merged_codes
+        os.replace(ids_tmp, self.sorted_ids_path)
+        os.replace(codes_tmp, self.sorted_codes_path)
+
+        self.indexed = end
+        self._map_sorted()
+        self.recent_buckets = [{} for _ in range(self.LSH_TABLES)]
+
+    # O'rtacha vektorni hisoblab saqlash va barcha LSH kodlarini u bilan qayta hisoblash.
+    # Fayllar shunday tartibda almashtiriladiki, uzilish bo'lsa keyingi yuklanishda
+    # hammasi qaytadan hisoblanadi.
+    def _fit_mean(self):
+        mean = np.asarray(self.vectors[:self.MEAN_SAMPLE_ROWS], dtype=np.float32).mean(axis=0)
+
+        for path in (self.sorted_ids_path, self.sorted_codes_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+        codes_tmp = self.codes_path + ".tmp"
+        with open(codes_tmp, 'wb') as f:
+            for start in range(0, self.count, self.CHUNK_ROWS):
+                chunk = np.asarray(self.vectors[start:start + self.CHUNK_ROWS], dtype=np.float32) - mean
+                bits = np.einsum('tbd,nd->ntb', self.planes, chunk) > 0
+                f.write((bits * self.bit_weights).sum(axis=2).astype(np.uint16).tobytes())
+        os.replace(codes_tmp, self.codes_path)
+
+        mean_tmp = self.mean_path + ".tmp"
+        mean.tofile(mean_tmp)
+        os.replace(mean_tmp, self.mean_path)
+
+        self.mean = mean
+        self.indexed = 0
+        self._map_sorted()
+        self.recent_buckets = [{} for _ in range(self.LSH_TABLES)]
+        self._remap()
+
+    def _normalize(self, vector):
+        vector = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _center(self, vector):
+        if self.mean is None:
+            return vector
+        return self._normalize(vector - self.mean)
+
+    def _hash(self, vector):
+        bits = (self.planes @ vector) > 0
+        return (bits * self.bit_weights).sum(axis=1).astype(np.uint16)
+
+    # Yangi embeddingni indeks oxiriga qo'shish
+    def add(self, vector, user_id, disease_name, confidence):
+        vector = self._normalize(vector)
+
+        with self.lock:
+            codes = self._hash(self._center(vector))
+            idx = self.count
+            try:
+                with open(self.vectors_path, 'ab') as f:
+                    f.write(vector.astype(np.float16).tobytes())
+                with open(self.codes_path, 'ab') as f:
+                    f.write(codes.tobytes())
+
+                with get_db_connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute('''
+                    INSERT INTO photo_embeddings (id, user_id, disease_name, confidence, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ''', (idx, user_id, disease_name, confidence, datetime.now()))
+                    conn.commit()
+            except Exception:
+                # Yozilgan qatorlarni bekor qilish, aks holda keyingi qatorlar id bilan mos kelmay qoladi
+                for path, size in ((self.vectors_path, idx * self.row_bytes), (self.codes_path, idx * self.code_bytes)):
+                    if os.path.exists(path) and os.path.getsize(path) > size:
+                        os.truncate(path, size)
+                raise
+
+            self.count += 1
+            self._remap()
+            for table, code in enumerate(codes.tolist()):
+                self.recent_buckets[table].setdefault(code, []).append(idx)
+
+            try:
+                if self.mean is None and self.count >= self.MEAN_SAMPLE_ROWS:
+                    self._fit_mean()
+                    self._merge()
+                elif self.count - self.indexed >= self.LSH_MERGE_ROWS:
+                    self._merge()
+            except Exception as e:
+                # Ish keyingi safar (yoki keyingi yuklanishda) qayta uriniladi
+                print(f"LSH indeksini yangilashda xatolik: {str(e)}")
+
+        return idx
+
+    # Eng o'xshash k ta rasmni topish (kosinus o'xshashligi bo'yicha)
+    def search(self, vector, k=5):
+        vector = self._normalize(vector)
+
+        candidates = []
+        with self.lock:
+            vectors = self.vectors
+            mean = self.mean
+            query = self._center(vector)
+            codes = self._hash(query)
+            for table, code in enumerate(codes.tolist()):
+                if self.indexed:
+                    start = np.searchsorted(self.sorted_codes[table], code, side='left')
+                    end = np.searchsorted(self.sorted_codes[table], code, side='right')
+                    candidates.append(np.asarray(self.sorted_ids[table][start:end]))
+                candidates.append(np.asarray(self.recent_buckets[table].get(code, ()), dtype=np.int32))
+
+        ids = np.unique(np.concatenate(candidates))
+        if not ids.size:
+            return []
+
+        # O'xshashlik markazlashtirilgan vektorlar bo'yicha hisoblanadi
+        rows = vectors[ids].astype(np.float32)
+        if mean is not None:
+            rows -= mean
+        norms = np.linalg.norm(rows, axis=1)
+        norms[norms == 0] = 1
+        similarities = (rows @ query) / norms
+        top = np.argsort(-similarities)[:k]
+        matches = [(int(ids[i]), float(similarities[i])) for i in top]
+
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            placeholders = ",".join("?" for _ in matches)
+            cursor.execute(f'''
+            SELECT e.id, e.user_id, u.username, e.disease_name, e.confidence, e.created_at
+            FROM photo_embeddings e
+            LEFT JOIN users u ON u.user_id = e.user_id
+            WHERE e.id IN ({placeholders})
+            ''', [idx for idx, _ in matches])
+            rows = {row[0]: row for row in cursor.fetchall()}
+
+        results = []
+        for idx, similarity in matches:
+            row = rows.get(idx)
+            if row is None:
+                continue
+            results.append({
+                'id': idx,
+                'user_id': row[1],
+                'username': row[2],
+                'disease_name': row[3],
+                'confidence': row[4],
+                'created_at': row[5],
+                'similarity': similarity
+            })
+        return results
+
+# Deyarli bir xil rasmlar uchun o'xshashlik chegarasi
+# (markazlashtirilgan kosinus; admin "O'xshash rasmlar" natijalari bo'yicha sozlanadi).
+# Boshqa rasmning natijasini noto'g'ri qaytarmaslik uchun ataylab qattiq tanlangan.
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.98"))
+
 # Modellarni yuklash
 try:
     # Modelni to'g'ridan-to'g'ri yuklash
@@ -591,6 +1139,33 @@ try:
 except Exception as e:
     print(f"Modellarni yuklashda xatolik: {str(e)}")
 
+# Embedding indeksini yuklash
+embedding_index = None
+try:
+    embedding_index = EmbeddingIndex(EMBEDDINGS_DIR, model.config.hidden_size)
+except Exception as e:
+    print(f"Embedding indeksini yuklashda xatolik: {str(e)}")
+
+# Rasmdan ViT CLS embeddingini olish
+def extract_embedding(image):
+    inputs = processor(images=image, return_tensors="pt")
+    with torch.no_grad():
+        outputs = model.vit(**inputs)
+    return outputs.last_hidden_state[:, 0, :]
+
+# Deyarli bir xil rasm avval aniqlangan bo'lsa, uning natijasini qaytarish.
+# Bu tezlik uchun emas: embedding olish uchun ViT baribir ishlaydi, tejaladigani
+# faqat bitta chiziqli klassifikator qatlami. Maqsad - bir o'simlikning ketma-ket
+# olingan rasmlariga foydalanuvchi bir xil javob olishi.
+def find_near_duplicate(embedding):
+    # O'rtacha vektor hali yo'q bo'lsa, o'xshashlik ishonchli emas
+    if embedding_index is None or embedding_index.mean is None:
+        return None
+    matches = embedding_index.search(embedding[0].numpy(), k=1)
+    if matches and matches[0]['similarity'] >= SIMILARITY_THRESHOLD:
+        return matches[0]
+    return None
+
 # Bashorat qilish funksiyasi
 def predict_with_model(image):
     inputs = processor(images=image, return_tensors="pt")
@@ -636,22 +1211,40 @@ def handle_photo(message):
         # Rasmni PIL Image formatiga o'tkazish
         image = Image.open(BytesIO(downloaded_file))
         
-        # Rasmni model uchun qayta ishlash
-        inputs = processor(images=image, return_tensors="pt")
-        
-        # Bashorat qilish
-        with torch.no_grad():
-            outputs = model(**inputs)
-            logits = outputs.logits
-            
-            # Eng yuqori ehtimollikdagi klassni topish
-            predicted_class_idx = logits.argmax(-1).item()
-            predicted_class = model.config.id2label[predicted_class_idx]
-            
-            # Ishonchlilik darajasini hisoblash
-            probabilities = torch.nn.functional.softmax(logits, dim=-1)
-            confidence = probabilities[0][predicted_class_idx].item()
-            confidence_percentage = round(confidence * 100, 2)
+        # Rasmni model uchun qayta ishlash va CLS embeddingni olish
+        embedding = extract_embedding(image)
+
+        # Deyarli bir xil rasm avval tekshirilgan bo'lsa, bir xil javob berish uchun
+        # saqlangan natijani ishlatish (qidiruv xatosi asosiy aniqlashni to'xtatmaydi)
+        try:
+            duplicate = find_near_duplicate(embedding)
+        except Exception as e:
+            print(f"O'xshash rasmni qidirishda xatolik: {str(e)}")
+            duplicate = None
+        if duplicate:
+            predicted_class = duplicate['disease_name']
+            confidence = duplicate['confidence']
+        else:
+            # Bashorat qilish (klassifikator CLS embedding ustida ishlaydi)
+            with torch.no_grad():
+                logits = model.classifier(embedding)
+
+                # Eng yuqori ehtimollikdagi klassni topish
+                predicted_class_idx = logits.argmax(-1).item()
+                predicted_class = model.config.id2label[predicted_class_idx]
+
+                # Ishonchlilik darajasini hisoblash
+                probabilities = torch.nn.functional.softmax(logits, dim=-1)
+                confidence = probabilities[0][predicted_class_idx].item()
+
+            # Embeddingni indeksga qo'shish
+            if embedding_index is not None:
+                try:
+                    embedding_index.add(embedding[0].numpy(), message.from_user.id, predicted_class, confidence)
+                except Exception as e:
+                    print(f"Embeddingni saqlashda xatolik: {str(e)}")
+
+        confidence_percentage = round(confidence * 100, 2)
         
         # Natijalarni tayyorlash
         disease_name = disease_names[lang].get(predicted_class, predicted_class)
@@ -676,6 +1269,51 @@ def handle_photo(message):
     except Exception as e:
         bot.reply_to(message, messages[lang]["error"] + str(e))
 
+@bot.message_handler(func=lambda message: message.text == "🔎 O'xshash rasmlar")
+def ask_similar_photo(message):
+    if not is_admin(message.from_user.id):
+        return
+    
+    if embedding_index is None:
+        bot.reply_to(message, "Embedding indeksi mavjud emas.")
+        return
+    
+    msg = bot.reply_to(message, "O'xshash aniqlashlarni qidirish uchun rasm yuboring:")
+    bot.register_next_step_handler(msg, show_similar_detections)
+
+# Admin yuborgan rasmga o'xshash avvalgi aniqlashlarni ko'rsatish
+def show_similar_detections(message):
+    if not message.photo:
+        bot.reply_to(message, "Rasm yuborilmadi.")
+        return
+    
+    try:
+        file_info = bot.get_file(message.photo[-1].file_id)
+        downloaded_file = bot.download_file(file_info.file_path)
+        image = Image.open(BytesIO(downloaded_file))
+        
+        embedding = extract_embedding(image)
+        matches = embedding_index.search(embedding[0].numpy(), k=5)
+        
+        if not matches:
+            bot.reply_to(message, "O'xshash rasmlar topilmadi.")
+            return
+        
+        text = "🔎 O'xshash aniqlashlar:\n\n"
+        for match in matches:
+            disease = disease_names["uz"].get(match['disease_name'], match['disease_name'])
+            text += f"👤 {match['username'] or match['user_id']}\n"
+            text += f"🦠 Kasallik: {disease}\n"
+            text += f"📊 Aniqlik: {round(match['confidence'] * 100, 2)}%\n"
+            text += f"🔗 O'xshashlik: {round(match['similarity'] * 100, 2)}%\n"
+            text += f"📅 Sana: {match['created_at']}\n"
+            text += "➖➖➖➖➖➖➖➖\n"
+        
+        bot.reply_to(message, text)
+        
+    except Exception as e:
+        bot.reply_to(message, f"Xatolik yuz berdi: {str(e)}")
+
 # Admin foydalanuvchilar ro'yxati
 ADMIN_IDS = [int(id_) for id_ in os.getenv("ADMIN_IDS", "").split(",") if id_]
 